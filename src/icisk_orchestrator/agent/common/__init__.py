@@ -1,4 +1,5 @@
 from . import names
 from . import states
 from . import utils
+from . import bbox_gazetteer
 from . import notebook_templates
\ No newline at end of file
@@ -0,0 +1,25 @@
+# DOC: Gazetteer of well-known areas (continents, regions, countries, capitals) and their bounding-box [min_x, min_y, max_x, max_y] in EPSG:4326
+
+import os
+import json
+
+
+
+# REGION: [Gazetteer]
+
+_GAZETTEER_FILE = os.path.join(os.path.dirname(__file__), 'bbox_gazetteer.json')
+
+with open(_GAZETTEER_FILE, 'r', encoding='utf-8') as f:
+    _GAZETTEER: dict[str, list[float]] = json.load(f)
+
+
+def normalize_area_name(area: str) -> str:
+    """ normalize_area_name - returns the lowercase area name with collapsed whitespaces """
+    return ' '.join(area.strip().lower().split())
+
+def bbox_from_gazetteer(area: str) -> list[float] | None:
+    """ bbox_from_gazetteer - returns the bounding-box of a known area name, otherwise None """
+    bbox = _GAZETTEER.get(normalize_area_name(area))
+    return list(bbox) if bbox is not None else None
+
+# ENDREGION: [Gazetteer]
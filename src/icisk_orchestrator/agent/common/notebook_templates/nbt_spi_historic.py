@@ -16,6 +16,7 @@ notebook_template.cells.extend([
         import os
         import math
         import datetime
+        import itertools
         from dateutil.relativedelta import relativedelta
         import getpass
 
@@ -31,6 +32,11 @@ notebook_template.cells.extend([
         !pip install "cdsapi>=0.7.4"
         import cdsapi
         
+        !pip install zarr dask
+        
+        !pip install numba
+        from numba import njit, prange
+        
         !pip install cartopy
         import cartopy.crs as ccrs
         import cartopy.feature as cfeature
@@ -86,6 +92,20 @@ notebook_template.cells.extend([
     """,
     metadata={ CellMetadata.CHECK_EXISTENCE: True }),
     
+    nbf.v4.new_code_cell("""
+        # Convert a downloaded NetCDF file to a chunked Zarr store (NetCDF is kept as archive, Zarr is used for computation)
+        def to_zarr(nc_path, chunks={'valid_time': -1, 'latitude': 64, 'longitude': 64}):
+            zarr_path = os.path.splitext(nc_path)[0] + '.zarr'
+            if not os.path.exists(zarr_path):
+                with xr.open_dataset(nc_path) as nc_data:
+                    for var in nc_data.variables.values():
+                        var.encoding.clear()
+                    nc_data = nc_data.chunk({dim: size for dim, size in chunks.items() if dim in nc_data.dims})
+                    nc_data.to_zarr(zarr_path, mode='w')
+            return zarr_path
+    """,
+    metadata={ CellMetadata.CHECK_EXISTENCE: True }),
+    
     nbf.v4.new_code_cell("""
         # Section "Get period-of-interest data"
         
@@ -107,22 +127,19 @@ notebook_template.cells.extend([
             factor = 10 ** decimals
             return math.ceil(number * factor) / factor
             
-        spi_start_date = init_time - relativedelta(months=spi_ts-1)
-        spi_years_range = list(range(spi_start_date.year, lead_time.year+1))
-        spi_month_range = []
-        for iy,year in enumerate(range(spi_years_range[0], spi_years_range[-1]+1)):
-            if iy==0 and len(spi_years_range)==1:
-                spi_month_range.append([month for month in range(spi_start_date.month, lead_time.month+1)])
-            elif iy==0 and len(spi_years_range)>1:
-                spi_month_range.append([month for month in range(spi_start_date.month, 13)])
-            elif iy>0 and iy==len(spi_years_range)-1:
-                spi_month_range.append([month for month in range(1, lead_time.month+1)])
-            else:
-                spi_month_range.append([month for month in range(1, 13)])
-
-        # CDS API query
+        # Get {year: [months]} for the CDS api query. (We can query just one month at time)
+        spi_start_date = start_time - relativedelta(months=spi_ts-1)
+        spi_periods = pd.period_range(start=spi_start_date, end=end_time, freq='M')
+        spi_year_months = {year: [p.month for p in periods] for year, periods in itertools.groupby(spi_periods, key=lambda p: p.year)}
+
+        # CDS API query (months already in the reference period are taken from cds_ref_data, no need to download them)
         cds_poi_data_filepaths = []
-        for q_idx, (year,year_months) in enumerate(zip(spi_years_range, spi_month_range)):
+        cds_poi_ref_months = []
+        for q_idx, (year,year_months) in enumerate(spi_year_months.items()):
+            if reference_period[0] <= year < reference_period[1]:
+                cds_poi_ref_months.extend([datetime.datetime(year, ym, 1) for ym in year_months if start_time <= datetime.datetime(year, ym, 1) <= end_time])
+                print(f'{q_idx+1}/{len(year_months)}/{len(spi_year_months)} - Data already available in reference period')
+                continue
             for ym in year_months:
                 cds_poi_data_filepath = build_cds_hourly_data_filepath(year, [ym])
                 if not os.path.exists(cds_poi_data_filepath):
@@ -130,7 +147,7 @@ notebook_template.cells.extend([
                     cds_query =  {
                         'variable': 'total_precipitation',
                         'year': [str(year)],
-                        'month': [f'{month:02d}' for month in year_months],
+                        'month': [f'{ym:02d}'],
                         'day': [f'{day:02d}' for day in range(1, 32)],
                         'time': [f'{hour:02d}:00' for hour in range(0, 24)],
                         'area': [
@@ -143,95 +160,173 @@ notebook_template.cells.extend([
                         "download_format": "unarchived"
                     }
                     cds_client.retrieve(cds_dataset, cds_query, cds_poi_data_filepath)
+                cds_poi_data_filepaths.append(cds_poi_data_filepath)
 
-            print(f'{q_idx+1}/{len(year_months)}/{len(spi_years_range)} - CDS API query completed')
-            cds_poi_data_filepaths.append(cds_poi_data_filepath)
+            print(f'{q_idx+1}/{len(year_months)}/{len(spi_year_months)} - CDS API query completed')
 
-        cds_poi_data = [xr.open_dataset(fp) for fp in cds_poi_data_filepaths]
-        cds_poi_data = xr.concat(cds_poi_data, dim='valid_time')
-        cds_poi_data = cds_poi_data.sel(valid_time=(cds_poi_data.valid_time.dt.date>=start_time.date()) & (cds_poi_data.valid_time.dt.date<=end_time.date()))
+        cds_poi_data = None
+        if len(cds_poi_data_filepaths) > 0:
+            cds_poi_data_zarrpaths = [to_zarr(fp) for fp in cds_poi_data_filepaths]
+            cds_poi_data = xr.open_mfdataset(cds_poi_data_zarrpaths, engine='zarr', chunks={}, combine='by_coords', parallel=True)
+            cds_poi_data = cds_poi_data.sel(valid_time=(cds_poi_data.valid_time.dt.date>=start_time.date()) & (cds_poi_data.valid_time.dt.date<=end_time.date()))
     """),
     
     nbf.v4.new_code_cell("""
+        # Round lat/lon coordinates and sort only the dimensions that are not already ordered
+        def round_and_sort_coords(dataset, decimals=6):
+            factor = 10 ** decimals
+            dataset = dataset.assign_coords(
+                lat=(dataset.lat.values * factor).round().astype(np.int64) / factor,
+                lon=(dataset.lon.values * factor).round().astype(np.int64) / factor,
+            )
+            unsorted_dims = [dim for dim in ['time', 'lat', 'lon'] if not dataset.indexes[dim].is_monotonic_increasing]
+            if len(unsorted_dims) > 0:
+                dataset = dataset.sortby(unsorted_dims)
+            return dataset
+
         # Preprocess reference dataset
         cds_ref_data = cds_ref_data.drop_vars(['number', 'expver'])
         cds_ref_data = cds_ref_data.rename({'valid_time': 'time', 'latitude': 'lat', 'longitude': 'lon'})
         cds_ref_data = cds_ref_data * cds_ref_data['time'].dt.days_in_month
-        cds_ref_data = cds_ref_data.assign_coords(
-            lat=np.round(cds_ref_data.lat.values, 6),
-            lon=np.round(cds_ref_data.lon.values, 6),
-        )
-        cds_ref_data = cds_ref_data.sortby(['time', 'lat', 'lon'])
+        cds_ref_data = round_and_sort_coords(cds_ref_data)
 
         # Preprocess period-of-interest dataset
-        cds_poi_data = cds_poi_data.drop_vars(['number', 'expver'])
-        cds_poi_data = cds_poi_data.rename({'valid_time': 'time', 'latitude': 'lat', 'longitude': 'lon'})
-        cds_poi_data = cds_poi_data.resample(time='1ME').sum()                                      # Resample to monthly total data
-        cds_poi_data = cds_poi_data.assign_coords(time=cds_poi_data.time.dt.strftime('%Y-%m-01'))   # Set month day to 01
-        cds_poi_data = cds_poi_data.assign_coords(time=pd.to_datetime(cds_poi_data.time))
-        cds_poi_data['tp'] = cds_poi_data['tp'] / 12                                                # Convert total precipitation to monthly average precipitation
-        cds_poi_data = cds_poi_data.assign_coords(
-            lat=np.round(cds_poi_data.lat.values, 6),
-            lon=np.round(cds_poi_data.lon.values, 6),
-        )
-        cds_poi_data = cds_poi_data.sortby(['time', 'lat', 'lon'])
-
-        # Get whole dataset
-        ts_dataset = xr.concat([cds_ref_data, cds_poi_data], dim='time')
-        ts_dataset = ts_dataset.drop_duplicates(dim='time').sortby(['time', 'lat', 'lon'])
+        if cds_poi_data is not None:
+            cds_poi_data = cds_poi_data.drop_vars(['number', 'expver'])
+            cds_poi_data = cds_poi_data.rename({'valid_time': 'time', 'latitude': 'lat', 'longitude': 'lon'})
+            cds_poi_data = cds_poi_data.resample(time='1ME').sum()                                      # Resample to monthly total data
+            cds_poi_data = cds_poi_data.assign_coords(time=cds_poi_data.time.dt.strftime('%Y-%m-01'))   # Set month day to 01
+            cds_poi_data = cds_poi_data.assign_coords(time=pd.to_datetime(cds_poi_data.time))
+            cds_poi_data['tp'] = cds_poi_data['tp'] / 12                                                # Convert total precipitation to monthly average precipitation
+            cds_poi_data = round_and_sort_coords(cds_poi_data)
+
+        # Period-of-interest months inside the reference period are taken from the (already scaled) reference dataset
+        if len(cds_poi_ref_months) > 0:
+            cds_poi_ref_data = cds_ref_data.sel(time=cds_ref_data.time.isin(cds_poi_ref_months))
+            cds_poi_data = cds_poi_ref_data if cds_poi_data is None else round_and_sort_coords(xr.concat([cds_poi_ref_data, cds_poi_data], dim='time'))
+
+        # Get whole dataset (both datasets are sorted: only period-of-interest months outside the reference period are added, no dedup / re-sort needed)
+        ts_dataset = xr.concat([
+            cds_poi_data.sel(time=cds_poi_data.time < cds_ref_data.time.min()),
+            cds_ref_data,
+            cds_poi_data.sel(time=cds_poi_data.time > cds_ref_data.time.max())
+        ], dim='time')
+
+        # Compute the (lazy, Zarr backed) dataset once: the SPI loop reads it once per month
+        ts_dataset = ts_dataset.load()
     """),
     
     nbf.v4.new_code_cell("""
-        # Compute SPI function
-        def compute_timeseries_spi(monthly_data, spi_ts, nt_return=1):
-            # Compute SPI index for a time series of monthly data
-            # REF: https://drought.emergency.copernicus.eu/data/factsheets/factsheet_spi.pdf
-            # REF: https://mountainscholar.org/items/842b69e8-a465-4aeb-b7ec-021703baa6af [ page 18 to 24 ]
-            
+        # Compute SPI function (Numba kernels, parallel over the grid pixels)
+        # REF: https://drought.emergency.copernicus.eu/data/factsheets/factsheet_spi.pdf
+        # REF: https://mountainscholar.org/items/842b69e8-a465-4aeb-b7ec-021703baa6af [ page 18 to 24 ]
+
+        @njit
+        def gamma_cdf(x, a, scale):
+            # Regularized lower incomplete gamma P(a, x/scale) — series expansion or continued fraction (Numerical Recipes)
+            x = x / scale
+            if x <= 0:
+                return 0.0
+            gln = math.lgamma(a)
+            if x < a + 1:
+                ap, term = a, 1.0 / a
+                total = term
+                for _ in range(500):
+                    ap += 1
+                    term *= x / ap
+                    total += term
+                    if abs(term) < abs(total) * 1e-12:
+                        break
+                return total * math.exp(-x + a * math.log(x) - gln)
+            b = x + 1 - a
+            c, d = 1e300, 1 / b
+            h = d
+            for i in range(1, 500):
+                an = -i * (i - a)
+                b += 2
+                d = an * d + b
+                d = 1e-300 if abs(d) < 1e-300 else d
+                c = b + an / c
+                c = 1e-300 if abs(c) < 1e-300 else c
+                d = 1 / d
+                h *= d * c
+                if abs(d * c - 1) < 1e-12:
+                    break
+            return 1 - math.exp(-x + a * math.log(x) - gln) * h
+
+        @njit
+        def compute_timeseries_spi_kernel(monthly_data, spi_ts):
+            # Compute SPI index of the last month of a time series of monthly data
+
             # SPI calculation needs finite-values and non-zero values
-            if all([md<=0 for md in monthly_data]):
-                return 0
-            if all([np.isnan(md) or md==0 for md in monthly_data]):
+            all_not_positive, all_nan_or_zero = True, True
+            for md in monthly_data:
+                if not md <= 0:
+                    all_not_positive = False
+                if not (np.isnan(md) or md == 0):
+                    all_nan_or_zero = False
+            if all_not_positive:
+                return 0.0
+            if all_nan_or_zero:
                 return np.nan
-            
-            df = pd.DataFrame({'monthly_data': monthly_data})
-
-            # Totalled data over t_scale rolling windows
-            if spi_ts > 1:
-                t_scaled_monthly_data = df.rolling(spi_ts).sum().monthly_data.iloc[spi_ts:]
-            else:
-                t_scaled_monthly_data = df.monthly_data
-                
-            t_scaled_monthly_data = t_scaled_monthly_data.fillna(1e-6)
-
-            # Gamma fitted params
-            a, _, b = stats.gamma.fit(t_scaled_monthly_data, floc=0)
 
-            # Cumulative probability distribution
-            G = lambda x: stats.gamma.cdf(x, a=a, loc=0, scale=b)
+            # Totalled data over t_scale rolling windows (running window sum, windows with NaN are set to 1e-6)
+            start = spi_ts if spi_ts > 1 else 0
+            n = len(monthly_data) - start
+            if n <= 0:
+                return np.nan
+            t_scaled_monthly_data = np.empty(n)
+            window_sum, window_nans = 0.0, 0
+            for i in range(len(monthly_data)):
+                if np.isnan(monthly_data[i]):
+                    window_nans += 1
+                else:
+                    window_sum += monthly_data[i]
+                if i >= spi_ts:
+                    if np.isnan(monthly_data[i - spi_ts]):
+                        window_nans -= 1
+                    else:
+                        window_sum -= monthly_data[i - spi_ts]
+                if i >= start:
+                    t_scaled_monthly_data[i - start] = window_sum if window_nans == 0 and i >= spi_ts - 1 else 1e-6
+
+            # Gamma fitted params (Thom's approximation of the maximum likelihood estimate over the non-zero values)
+            m, sum_x, sum_log_x = 0, 0.0, 0.0
+            for x in t_scaled_monthly_data:
+                if x > 0:
+                    sum_x += x
+                    sum_log_x += math.log(x)
+                else:
+                    m += 1
+            if m == n:
+                return np.nan
+            mean_x = sum_x / (n - m)
+            A = math.log(mean_x) - sum_log_x / (n - m)
+            if A <= 0:
+                return np.nan
+            a = (1 + math.sqrt(1 + 4 * A / 3)) / (4 * A)
+            b = mean_x / a
 
-            m = (t_scaled_monthly_data==0).sum()
-            n = len(t_scaled_monthly_data)
             q = m / n # zero prob
+            Hx = q + (1 - q) * gamma_cdf(t_scaled_monthly_data[-1], a, b) # zero correction
+            Hx = min(max(Hx, 1e-12), 1 - 1e-12)
 
-            H = lambda x: q + (1-q) * G(x) # zero correction
-
-            t = lambda Hx: math.sqrt(
-                math.log(1 /
-                (math.pow(Hx, 2) if 0<Hx<=0.5 else math.pow(1-Hx, 2))
-            ))
+            tx = math.sqrt(math.log(1 / (Hx ** 2 if Hx <= 0.5 else (1 - Hx) ** 2)))
 
             c0, c1, c2 = 2.515517, 0.802853, 0.010328
             d1, d2, d3 = 1.432788, 0.189269, 0.001308
 
-            Hxs = t_scaled_monthly_data[-spi_ts:].apply(H)
-            txs = Hxs.apply(t)
-
-            Z = lambda Hx, tx: ( tx - ((c0 + c1*tx + c2*math.pow(tx,2)) / (1 + d1*tx + d2*math.pow(tx,2) + d3*math.pow(tx,3) )) ) * (-1 if 0<Hx<=0.5 else 1)
-
-            spi_t_indexes = pd.DataFrame(zip(Hxs, txs), columns=['H','t']).apply(lambda x: Z(x.H, x.t), axis=1).to_list()
-
-            return np.array(spi_t_indexes[-nt_return]) if nt_return==1 else np.array(spi_t_indexes[-nt_return:])
+            return (tx - ((c0 + c1 * tx + c2 * tx ** 2) / (1 + d1 * tx + d2 * tx ** 2 + d3 * tx ** 3))) * (-1 if Hx <= 0.5 else 1)
+
+        @njit(parallel=True)
+        def spi_grid(tp3d, spi_ts):
+            # Compute SPI of the last month for each pixel of a (time, lat, lon) array
+            _, H, W = tp3d.shape
+            out = np.empty((H, W))
+            for i in prange(H):
+                for j in range(W):
+                    out[i, j] = compute_timeseries_spi_kernel(np.ascontiguousarray(tp3d[:, i, j]), spi_ts)
+            return out
     """,
     metadata={ CellMetadata.CHECK_EXISTENCE: True }),
     
@@ -239,11 +334,12 @@ notebook_template.cells.extend([
         # Compute SPI dataset
         month_spi_coverages = []
         for month in cds_poi_data.time:
-            month_spi_coverage = xr.apply_ufunc(
-                lambda tile_timeseries: compute_timeseries_spi(tile_timeseries, spi_ts=spi_ts, nt_return=1),
-                ts_dataset.sel(time=ts_dataset.time<=month).tp.sortby('time'),
-                input_core_dims = [['time']],
-                vectorize = True
+            month_tp = ts_dataset.sel(time=ts_dataset.time<=month).tp.sortby('time').transpose('time', 'lat', 'lon')
+            month_spi_coverage = xr.DataArray(
+                spi_grid(np.ascontiguousarray(month_tp.values, dtype=np.float64), spi_ts),
+                coords = {'lat': month_tp.lat, 'lon': month_tp.lon},
+                dims = ('lat', 'lon'),
+                name = 'tp'
             )
             month_spi_coverages.append((
                 month.dt.date.item(),
@@ -257,6 +353,9 @@ notebook_template.cells.extend([
         dataset_spi_historic = xr.concat(spi_grids, dim='time').to_dataset()
         dataset_spi_historic = dataset_spi_historic.assign_coords({'time': spi_times})
         dataset_spi_historic = dataset_spi_historic.rename_vars({'tp': 'spi_hist'})
+
+        # SPI is a standardized index (useful range about ±4): float32 keeps ~7 significant digits, more than enough, at half the memory of float64
+        dataset_spi_historic = dataset_spi_historic.astype('float32')
     """),
     
     nbf.v4.new_code_cell("""
@@ -1,6 +1,7 @@
 import os
 import re
 import copy
+import json
 
 import nbformat as nbf
 
@@ -16,6 +17,13 @@ class CellMetadata():
 
 def notebook_copy(notebook: nbf.NotebookNode) -> nbf.NotebookNode:
     return copy.deepcopy(notebook)   
+
+
+def serialize_cells(notebook: nbf.NotebookNode) -> str:
+    return json.dumps(notebook.cells)
+
+def cells_copy(cells_json: str) -> list[nbf.NotebookNode]:
+    return nbf.from_dict(json.loads(cells_json))   # DOC: Fresh mutable cells from a template serialized once — cheaper than deepcopy
  
 
 def write_notebook_template(notebook: nbf.NotebookNode, values_dict: dict = dict(), mode = None) -> nbf.NotebookNode:
@@ -1,5 +1,7 @@
 # DOC: Chatbot node and router
 
+import functools
+
 from typing_extensions import Literal
 
 from langgraph.graph import END
@@ -42,6 +44,8 @@ tool_node = ToolNode([tool for tool in tools_map.values()])
 llm_with_tools = utils._base_llm.bind_tools([tool for tool in tools_map.values()])
 
 
+# DOC: Binding converts every tool schema for the LLM provider — done once per tool_choice value and reused by the chatbot node
+@functools.lru_cache(maxsize=None)
 def set_tool_choice(tool_choice: str = None) -> Runnable[LanguageModelInput, BaseMessage]:
     if tool_choice is None:
         llm_with_tools = utils._base_llm.bind_tools([tool for tool in tools_map.values()])
@@ -15,11 +15,15 @@ from langchain_core.callbacks import (
 from agent import utils
 from agent import names as N
 from agent.nodes.base import BaseAgentTool
+from agent.common import bbox_gazetteer
 from agent.common.notebook_templates import nbt_utils
 from agent.common.notebook_templates.nbt_cds_forecast import notebook_template as nbt_cds_forecast
 from db import DBI, DBS
 
 
+# DOC: Template cells serialized once at import, each tool call rebuilds a fresh (mutable) copy from it
+_TEMPLATE_CELLS_JSON = nbt_utils.serialize_cells(nbt_cds_forecast)
+
 
 # DOC: This is a tool that exploits I-Cisk API to ingests forecast data from the Climate Data Store (CDS) API and saves it in a zarr format. It build a jupyter notebook to do that.
 class CDSForecastNotebookTool(BaseAgentTool):
@@ -217,6 +221,9 @@ class CDSForecastNotebookTool(BaseAgentTool):
         def infer_area(**ka):
             def bounding_box_from_location_name(area):
                 if type(area) is str:
+                    gazetteer_bbox = bbox_gazetteer.bbox_from_gazetteer(area)
+                    if gazetteer_bbox is not None:
+                        return gazetteer_bbox
                     area = utils.ask_llm(
                         role = 'system',
                         message = f"""Please provide the bounding box coordinates for the area: {area} with format [min_x, min_y, max_x, max_y] in EPSG:4326 Coordinate Reference System. 
@@ -295,7 +302,7 @@ class CDSForecastNotebookTool(BaseAgentTool):
                 authors = self.graph_state.get('user_id'),
                 source = nbf.v4.new_notebook()
             )
-        self.notebook.source.cells.extend(nbt_utils.notebook_copy(nbt_cds_forecast).cells)
+        self.notebook.source.cells += nbt_utils.cells_copy(_TEMPLATE_CELLS_JSON)
     
     
     # DOC: Execute the tool → Build notebook, write it to a file and return the path to the notebook and the zarr output file
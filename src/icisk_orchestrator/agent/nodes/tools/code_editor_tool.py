@@ -85,7 +85,7 @@ class CodeEditorTool(BaseAgentTool):
             if source_code.startswith('```python\n'):
                 source_code = source_code.split('```python\n')[1].split('\n```')[0]
             
-            self.notebook.source.cells.append(new_code_cell(source = source_code))
+            self.notebook.add_cells(new_code_cell(source = source_code))
             DBI.save_notebook(self.notebook)#**self.notebook.as_dict)
                     
         if not self.output_confirmed:
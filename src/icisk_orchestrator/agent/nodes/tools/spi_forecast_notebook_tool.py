@@ -15,6 +15,7 @@ from langchain_core.callbacks import (
 
 from agent import utils
 from agent.common import names as N
+from agent.common import bbox_gazetteer
 from agent.common.notebook_templates import nbt_utils
 from agent.common.notebook_templates.nbt_spi_forecast import notebook_template as nbt_spi_forecast
 
@@ -23,6 +24,9 @@ from agent.nodes.base import BaseAgentTool
 from db import DBI, DBS
 
 
+# DOC: Template cells serialized once at import, each tool call rebuilds a fresh (mutable) copy from it
+_TEMPLATE_CELLS_JSON = nbt_utils.serialize_cells(nbt_spi_forecast)
+
 
 # DOC: This is a tool that exploits I-Cisk API to calculate SPI (Standard Precipitation Index) for a given location in a give time period.
 
@@ -150,6 +154,9 @@ class SPIForecastNotebookTool(BaseAgentTool):
         def infer_area(**ka):
             def bounding_box_from_location_name(area):
                 if type(area) is str:
+                    gazetteer_bbox = bbox_gazetteer.bbox_from_gazetteer(area)
+                    if gazetteer_bbox is not None:
+                        return gazetteer_bbox
                     area = utils.ask_llm(
                         role = 'system',
                         message = f"""Please provide the bounding box coordinates for the area: {area} with format [min_x, min_y, max_x, max_y] in EPSG:4326 Coordinate Reference System. 
@@ -193,7 +200,7 @@ class SPIForecastNotebookTool(BaseAgentTool):
                 source = nbf.v4.new_notebook()
             )
           
-        self.notebook.source.cells.extend(nbt_utils.notebook_copy(nbt_spi_forecast).cells)    
+        self.notebook.source.cells += nbt_utils.cells_copy(_TEMPLATE_CELLS_JSON)    
         
         
     # DOC: Execute the tool → Build notebook, write it to a file and return the path to the notebook and the zarr output file
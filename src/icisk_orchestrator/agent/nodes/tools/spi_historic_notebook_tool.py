@@ -1,5 +1,8 @@
 import os
 import datetime
+import functools
+import threading
+import concurrent.futures
 from dateutil import relativedelta
 
 from enum import Enum
@@ -15,6 +18,7 @@ from langchain_core.callbacks import (
 
 from agent import utils
 from agent.common import names as N
+from agent.common import bbox_gazetteer
 from agent.common.notebook_templates import nbt_utils
 from agent.common.notebook_templates.nbt_spi_historic import notebook_template as nbt_spi_historic
 from agent.nodes.base import BaseAgentTool
@@ -23,6 +27,117 @@ from db import DBI, DBS
 
 
 
+# DOC: Month deltas used for default start / end time, built once
+_DELTA_M1 = relativedelta.relativedelta(months=1)
+_DELTA_M2 = relativedelta.relativedelta(months=2)
+
+# DOC: Template cells serialized once at import, each tool call rebuilds a fresh (mutable) copy from it
+_TEMPLATE_CELLS_JSON = nbt_utils.serialize_cells(nbt_spi_historic)
+
+
+# DOC: Parse a YYYY-MM-DD date string, using the C-accelerated ISO parser when possible (memoized: rules parse the same start / end time more than once)
+@functools.lru_cache(maxsize=256)
+def _parse_ymd(s: str) -> datetime.datetime:
+    if len(s) == 10 and s[4] == '-' and s[7] == '-' and s[:4].isdigit():   # DOC: Only plain YYYY-MM-DD (fromisoformat also takes e.g. week dates, the notebook strptime does not)
+        try:
+            return datetime.datetime.fromisoformat(s)
+        except ValueError:
+            pass
+    return datetime.datetime.strptime(s, "%Y-%m-%d")
+
+
+# DOC: Ask the LLM for the bounding-box of a (normalized) area name, results are memoized so repeated names skip the LLM call (invalid answers are not cached)
+@functools.lru_cache(maxsize=1024)
+def _bbox_for_name(name: str) -> tuple[float, float, float, float]:
+    bbox = utils.ask_llm(
+        role = 'system',
+        message = f"""Please provide the bounding box coordinates for the area: {name} with format [min_x, min_y, max_x, max_y] in EPSG:4326 Coordinate Reference System. 
+        Provide only the coordinates list without any additional text or explanation.""",
+        eval_output = True
+    )
+    if type(bbox) not in (list, tuple) or len(bbox) != 4:
+        raise ValueError(f"Invalid bounding box for area {name}: {bbox}")
+    return tuple(float(c) for c in bbox)
+
+
+# DOC: Single-flight over _bbox_for_name — concurrent tool runs asking for the same (not yet cached) area share one in-flight LLM call
+_inflight_lock = threading.Lock()
+_inflight: dict[str, concurrent.futures.Future] = dict()
+
+def _bbox_for_name_coalesced(name: str) -> tuple[float, float, float, float]:
+    with _inflight_lock:
+        future = _inflight.get(name)
+        is_leader = future is None
+        if is_leader:
+            future = _inflight[name] = concurrent.futures.Future()
+    if is_leader:
+        try:
+            future.set_result(_bbox_for_name(name))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with _inflight_lock:
+                _inflight.pop(name, None)
+    return future.result()
+
+
+# DOC: Validation rules ( i.e.: valid init and lead time ... ) — built once at import time, the request time is bound as `_now` by the tool
+_ARGS_VALIDATION_RULES = {
+    'area': [
+        lambda **ka: f"Invalid area coordinates: {ka['area']}. It should be a list of 4 float values representing the bounding box [min_x, min_y, max_x, max_y]." 
+            if isinstance(ka['area'], list) and len(ka['area']) != 4 else None  
+    ],
+    'reference_period': [
+        lambda **ka: f"Invalid reference_period: {ka['reference_period']}. It should be a tuple of start and ending year as integers."
+            if type(ka['reference_period']) not in (tuple, list) or len(ka['reference_period']) != 2 else None,
+        lambda _now, **ka: f"Invalid reference_period: {ka['reference_period']}. It should be in the past, at least in the previous year."
+            if ka['reference_period'][1] > _now.year else None
+    ],
+    'start_time': [
+        lambda **ka: f"Invalid start time: {ka['start_time']}. It should be in the format YYYY-MM-DD."
+            if ka['start_time'] is not None and utils.try_default(lambda: _parse_ymd(ka['start_time']), None) is None else None,
+        lambda _now, **ka: f"Invalid start time: {ka['start_time']}. It should be in the past, at least in the previous month."
+            if ka['start_time'] is not None and _parse_ymd(ka['start_time']) > _now.replace(day=1) else None
+    ],
+    'end_time': [
+        lambda **ka: f"Invalid end time: {ka['end_time']}. It should be in the format YYYY-MM-DD."
+            if ka['end_time'] is not None and utils.try_default(lambda: _parse_ymd(ka['end_time']), None) is None else None,
+        lambda **ka: f"Invalid end time: {ka['end_time']}. It should be in the after the init time."
+            if ka['start_time'] is not None and ka['end_time'] is not None and utils.try_default(lambda: _parse_ymd(ka['end_time']) < _parse_ymd(ka['start_time']), False) else None,
+        lambda _now, **ka: f"Invalid end time: {ka['end_time']}. It should be at least in the previous month."
+            if ka['end_time'] is not None and _parse_ymd(ka['end_time']) > _now.replace(day=1) else None
+    ],
+    'jupyter_notebook': [
+        lambda **ka: f"Invalid notebook path: {ka['jupyter_notebook']}. It should be a valid jupyter notebook file path."
+            if ka['jupyter_notebook'] is not None and not ka['jupyter_notebook'].lower().endswith('.ipynb') else None
+    ]
+}
+
+
+# DOC: Inference rules not depending on the tool instance ( i.e.: default start and end time ... ) — built once at import time, the request time is bound as `_now` by the tool
+def _infer_start_time(_now, **ka):
+    if ka['start_time'] is None:
+        return (_now.date() - _DELTA_M2).strftime('%Y-%m-01')
+    return ka['start_time']
+
+def _infer_end_time(_now, **ka):
+    if ka['end_time'] is None:
+        return (_now.date() - _DELTA_M1).strftime('%Y-%m-01')
+    return ka['end_time']
+
+def _infer_jupyter_notebook(_now, **ka):
+    if ka['jupyter_notebook'] is None:
+        return f"icisk-ai_spi-historic_{_now.isoformat(timespec='seconds').replace(':','-')}.ipynb"
+    return ka['jupyter_notebook']
+
+_ARGS_INFERENCE_RULES = {
+    'start_time': _infer_start_time,
+    'end_time': _infer_end_time,
+    'jupyter_notebook': _infer_jupyter_notebook
+}
+
+
+
 # DOC: This is a tool that exploits I-Cisk API to calculate SPI (Standard Precipitation Index) for a given location in a give time period.
 
 class SPIHistoricNotebookTool(BaseAgentTool):
@@ -59,7 +174,7 @@ class SPIHistoricNotebookTool(BaseAgentTool):
         )
         start_time: None | str = Field(
             title = "Start Time",
-            description = f"The start datetime provided in UTC-0 YYYY-MM-DD. If not specified use {(datetime.datetime.now() - relativedelta.relativedelta(months=2)).strftime('%Y-%m-01')} as default.",
+            description = f"The start datetime provided in UTC-0 YYYY-MM-DD. If not specified use {(datetime.datetime.now() - _DELTA_M2).strftime('%Y-%m-01')} as default.",
             examples = [
                 None,
                 "2025-01-01",
@@ -70,7 +185,7 @@ class SPIHistoricNotebookTool(BaseAgentTool):
         )
         end_time: None | str = Field(
             title = "End Time",
-            description = f"The end date provided in UTC-0 YYYY-MM-DD. It must be after the start_time arg. If not specified use: {(datetime.datetime.now() - relativedelta.relativedelta(months=-1)).strftime('%Y-%m-01')} as default.",
+            description = f"The end date provided in UTC-0 YYYY-MM-DD. It must be after the start_time arg. If not specified use: {(datetime.datetime.now() - _DELTA_M1).strftime('%Y-%m-01')} as default.",
             examples = [
                 None,
                 "2025-02-01",
@@ -93,6 +208,7 @@ class SPIHistoricNotebookTool(BaseAgentTool):
         
     # DOC: Additional tool args
     notebook: DBS.Notebook = None
+    _request_now: datetime.datetime = None     # DOC: Single timestamp per tool run, shared by validation and inference rules
 
 
     # DOC: Initialize the tool with a name, description and args_schema
@@ -110,75 +226,25 @@ class SPIHistoricNotebookTool(BaseAgentTool):
         
     # DOC: Validation rules ( i.e.: valid init and lead time ... ) 
     def _set_args_validation_rules(self) -> dict:
-        
-        return {
-            'area': [
-                lambda **ka: f"Invalid area coordinates: {ka['area']}. It should be a list of 4 float values representing the bounding box [min_x, min_y, max_x, max_y]." 
-                    if isinstance(ka['area'], list) and len(ka['area']) != 4 else None  
-            ],
-            'reference_period': [
-                lambda **ka: f"Invalid reference_period: {ka['reference_period']}. It should be a tuple of start and ending year as integers."
-                    if type(ka['reference_period']) not in (tuple, list) or len(ka['reference_period']) != 2 else None,
-                lambda **ka: f"Invalid reference_period: {ka['reference_period']}. It should be in the past, at least in the previous year."
-                    if ka['reference_period'][1] > datetime.datetime.now().year else None
-            ],
-            'start_time': [
-                lambda **ka: f"Invalid start time: {ka['start_time']}. It should be in the format YYYY-MM-DD."
-                    if ka['start_time'] is not None and utils.try_default(lambda: datetime.datetime.strptime(ka['start_time'], "%Y-%m-%d"), None) is None else None,
-                lambda **ka: f"Invalid start time: {ka['start_time']}. It should be in the past, at least in the previous month."
-                    if ka['start_time'] is not None and datetime.datetime.strptime(ka['start_time'], '%Y-%m-%d') > datetime.datetime.now().replace(day=1) else None
-            ],
-            'end_time': [
-                lambda **ka: f"Invalid end time: {ka['end_time']}. It should be in the format YYYY-MM-DD."
-                    if ka['end_time'] is not None and utils.try_default(lambda: datetime.datetime.strptime(ka['end_time'], "%Y-%m-%d"), None) is None else None,
-                lambda **ka: f"Invalid end time: {ka['end_time']}. It should be in the after the init time."
-                    if ka['start_time'] is not None and ka['end_time'] is not None and utils.try_default(lambda: datetime.datetime.strptime(ka['end_time'], '%Y-%m-%d') < datetime.datetime.strptime(ka['start_time'], '%Y-%m-%d'), False) else None,
-                lambda **ka: f"Invalid end time: {ka['end_time']}. It should be at least in the previous month."
-                    if ka['end_time'] is not None and datetime.datetime.strptime(ka['end_time'], '%Y-%m-%d') > datetime.datetime.now().replace(day=1) else None
-            ],
-            'jupyter_notebook': [
-                lambda **ka: f"Invalid notebook path: {ka['jupyter_notebook']}. It should be a valid jupyter notebook file path."
-                    if ka['jupyter_notebook'] is not None and not ka['jupyter_notebook'].lower().endswith('.ipynb') else None
-            ]
-        }
+        return { arg: [functools.partial(rule, _now=self._request_now) for rule in rules] for arg, rules in _ARGS_VALIDATION_RULES.items() }
     
     
     # DOC: Inference rules ( i.e.: from location name to bbox ... )
+    def _infer_area(self, **ka):
+        def bounding_box_from_location_name(area):
+            if type(area) is str:
+                gazetteer_bbox = bbox_gazetteer.bbox_from_gazetteer(area)
+                if gazetteer_bbox is not None:
+                    return gazetteer_bbox
+                area = utils.try_default(lambda: list(_bbox_for_name_coalesced(bbox_gazetteer.normalize_area_name(area))), area)
+                self.execution_confirmed = False
+            return area
+        return bounding_box_from_location_name(ka['area'])
+    
     def _set_args_inference_rules(self) -> dict:
-        
-        def infer_area(**ka):
-            def bounding_box_from_location_name(area):
-                if type(area) is str:
-                    area = utils.ask_llm(
-                        role = 'system',
-                        message = f"""Please provide the bounding box coordinates for the area: {area} with format [min_x, min_y, max_x, max_y] in EPSG:4326 Coordinate Reference System. 
-                        Provide only the coordinates list without any additional text or explanation.""",
-                        eval_output = True
-                    )
-                    self.execution_confirmed = False
-                return area
-            return bounding_box_from_location_name(ka['area'])
-        
-        def infer_start_time(**ka):
-            if ka['start_time'] is None:
-                return (datetime.datetime.now().date() - relativedelta.relativedelta(month=2)).strftime('%Y-%m-01')
-            return ka['start_time']
-        
-        def infer_end_time(**ka):
-            if ka['end_time'] is None:
-                return (datetime.datetime.now().date() - relativedelta.relativedelta(month=1)).strftime('%Y-%m-01')
-            return ka['end_time']
-        
-        def infer_jupyter_notebook(**ka):
-            if ka['jupyter_notebook'] is None:
-                return f"icisk-ai_spi-historic_{datetime.datetime.now().isoformat(timespec='seconds').replace(':','-')}.ipynb"
-            return ka['jupyter_notebook']
-        
         return {
-            'area': infer_area,
-            'start_time': infer_start_time,
-            'end_time': infer_end_time,
-            'jupyter_notebook': infer_jupyter_notebook
+            'area': self._infer_area,
+            **{ arg: functools.partial(rule, _now=self._request_now) for arg, rule in _ARGS_INFERENCE_RULES.items() }
         }
         
     
@@ -192,7 +258,7 @@ class SPIHistoricNotebookTool(BaseAgentTool):
                 source = nbf.v4.new_notebook()
             )
           
-        self.notebook.source.cells.extend(nbt_utils.notebook_copy(nbt_spi_historic).cells)    
+        self.notebook.source.cells += nbt_utils.cells_copy(_TEMPLATE_CELLS_JSON)    
         
         
     # DOC: Execute the tool → Build notebook, write it to a file and return the path to the notebook and the zarr output file
@@ -233,6 +299,8 @@ class SPIHistoricNotebookTool(BaseAgentTool):
         run_manager: None | Optional[CallbackManagerForToolRun] = None
     ) -> dict:
         
+        self._request_now = datetime.datetime.now()
+        
         return super()._run(
             tool_args = {
                 "area": area,
@@ -1,7 +1,9 @@
 # Deps
+import logging
 from functools import singledispatchmethod
 
 from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure, PyMongoError
 from bson import ObjectId
 
 import nbformat as nbf
@@ -10,28 +12,69 @@ from db import DBS, db_utils
 
 # DB general
 
+logger = logging.getLogger(__name__)
+
 _DB_NAME = 'icisk_orchestrator_db'   # TODO: Change to env var
 _CONNECTION_STRING = 'mongodb://localhost:27017/'   # TODO: Change to env var
 
+# DOC: Module-level pooled client, shared by every request (pymongo is thread-safe and opens sockets lazily with connect=False)
+_CLIENT = MongoClient(
+    _CONNECTION_STRING,
+    maxPoolSize = 50,
+    minPoolSize = 5,
+    maxIdleTimeMS = 5 * 60 * 1000,     # DOC: Idle sockets recycled by the pool (minPoolSize kept warm) before NAT / server timeouts silently drop them
+    tz_aware = False,
+    connect = False
+)
+
+# DOC: Indexes are created once per process, on first database access
+_indexes_created = False
+_NOTEBOOKS_AUTHORS_NAME_INDEX = 'authors_1_name_1'
+
 class DatabaseInterface():    
     
-    client = None
-    db = None
-    
     def __init__(self):
         self.connection_string = _CONNECTION_STRING
         self.db_name = _DB_NAME
         
+    
+    @property
+    def client(self):
+        return _CLIENT
+    
+    @property
+    def db(self):
+        db = _CLIENT[self.db_name]
+        if not _indexes_created:
+            self.ensure_indexes(db)
+        return db
+    
+    def ensure_indexes(self, db):
+        """
+        Create the indexes backing the interface lookups (idempotent on MongoDB side), retried on next access if the server was not reachable.
+        """
         
-    def connect(self):
-        if self.client is None:
-            self.client = MongoClient(self.connection_string)
-            self.db = self.client[self.db_name]
+        global _indexes_created
         
-    def disconnect(self):
-        if self.client is not None:
-            self.client.close()
-            self.client = None
+        try:
+            db[DBS.Collections.NOTEBOOKS].create_index([('authors', 1), ('name', 1)], name=_NOTEBOOKS_AUTHORS_NAME_INDEX, background=True)
+        except ConnectionFailure as e:
+            logger.warning(f'Notebooks index creation failed, will retry: {e}')
+            return
+        except PyMongoError as e:
+            logger.error(f'Notebooks index creation failed: {e}')
+            
+        # DOC: Unique indexes apart, existing duplicates make them fail (not retried, it would fail again)
+        for collection, key in ((DBS.Collections.CHATS, 'thread_id'), (DBS.Collections.USERS, 'user_id')):
+            try:
+                db[collection].create_index(key, unique=True)
+            except ConnectionFailure as e:
+                logger.warning(f'{collection}.{key} unique index creation failed, will retry: {e}')
+                return
+            except PyMongoError as e:
+                logger.error(f'{collection}.{key} unique index creation failed: {e}')
+        
+        _indexes_created = True
             
     
     def save_notebook(
@@ -48,23 +91,40 @@ class DatabaseInterface():
             notebook_description (str): Description of the notebook.
         """
         
-        self.connect()
-        
         notebooks_collection = self.db[DBS.Collections.NOTEBOOKS]
         
         # DOC: All notebooks will be visible to admin
         if 'admin' not in notebook.authors:
             notebook.authors.append('admin')
         
-        # DOC: If notebook_id is None, we are creating a new notebook, otherwise we are updating an existing one
+        # DOC: If notebook_id is None, we are creating a new notebook, otherwise we are updating an existing one (no longer matching its uploaded file)
+        if notebook._id is not None:
+            notebook.source_hash = None
+        
         if notebook._id is None:
             insert_result = notebooks_collection.insert_one(notebook.as_anon_dict)
+            notebook._id = insert_result.inserted_id     # DOC: as_anon_dict is a copy, set the id so that a later save updates this record
             print(f'Inserted notebook result: {insert_result}')
         else:
-            notebooks_collection.update_one(
-                { '_id': notebook._id },
-                { '$set': notebook.as_anon_dict }
-            )
+            pushed = False
+            if len(notebook.pending_cells) > 0:
+                # DOC: Only new cells were appended (see DBS.Notebook.add_cells) → push them instead of rewriting the whole source (document sources only, legacy JSON string ones are not matched)
+                pushed = notebooks_collection.update_one(
+                    { '_id': notebook._id, 'source': { '$type': 'object' } },
+                    { 
+                        '$push': { 'source.cells': { '$each': [ dict(cell) for cell in notebook.pending_cells ] } },
+                        '$addToSet': { 'authors': { '$each': notebook.authors } },
+                        '$set': { 'source_hash': None }
+                    }
+                ).matched_count > 0
+            if not pushed:
+                # DOC: Full rewrite (also migrates legacy JSON string sources to documents)
+                notebooks_collection.update_one(
+                    { '_id': notebook._id },
+                    { '$set': notebook.as_anon_dict }
+                )
+        
+        notebook.empty_pending()
             
             
     def notebook_by_name(self, author: str, notebook_name: str, retrieve_source: bool = False) -> DBS.Notebook:
@@ -79,20 +139,36 @@ class DatabaseInterface():
             dict: Notebook document.
         """
         
-        self.connect()
-        
         notebooks_collection = self.db[DBS.Collections.NOTEBOOKS]
         
-        # DOC: Retrieve the notebook by its name
-        if retrieve_source:
-            notebook = notebooks_collection.find_one({ 'authors': author, 'name': notebook_name })
-        else:
-            notebook = notebooks_collection.find_one({ 'authors': author, 'name': notebook_name }, { 'source': 0 })
+        # DOC: Retrieve the notebook by its name (the source blob is skipped unless requested)
+        projection = None if retrieve_source else { 'source': 0 }
+        notebook = notebooks_collection.find_one({ 'authors': author, 'name': notebook_name }, projection)
         
         notebook = db_utils.cast_to_schema(DBS.Notebook, notebook)
         return notebook
         
         
+    def notebook_hash(self, author: str, notebook_name: str) -> str | None:
+        """
+        Retrieve the uploaded file digest of a notebook.
+        
+        Parameters:
+            author (str): The author of the notebook.
+            notebook_name (str): The name of the notebook.
+        
+        Returns:
+            str: Digest of the last uploaded file with that name, None if missing or modified after upload.
+        """
+        
+        notebooks_collection = self.db[DBS.Collections.NOTEBOOKS]
+        
+        # DOC: Only the digest is read, latest notebook first (uploads insert a new record)
+        notebook = notebooks_collection.find_one({ 'authors': author, 'name': notebook_name }, { 'source_hash': 1 }, sort=[('_id', -1)])
+        
+        return notebook.get('source_hash', None) if notebook is not None else None
+    
+    
     def notebooks_by_author(self, author: str, retrieve_source: bool = False):
         """
         Retrieve all notebooks by a given author.
@@ -105,15 +181,11 @@ class DatabaseInterface():
             list: List of notebooks by the author.
         """
         
-        self.connect()
-        
-        notebooks_collection = self.db['notebooks']
+        notebooks_collection = self.db[DBS.Collections.NOTEBOOKS]
         
-        # DOC: Retrieve all notebooks by the author
-        if retrieve_source:
-            notebooks = list(notebooks_collection.find({ 'authors': author }))
-        else:
-            notebooks = list(notebooks_collection.find({ 'authors': author }, { 'source': 0 }))
+        # DOC: Retrieve all notebooks by the author (the source blob is skipped unless requested)
+        projection = None if retrieve_source else { 'source': 0 }
+        notebooks = list(notebooks_collection.find({ 'authors': author }, projection))
         
         notebooks = db_utils.cast_to_schema(DBS.Notebook, notebooks)
         return notebooks
@@ -130,8 +202,6 @@ class DatabaseInterface():
             dict: User document.
         """
         
-        self.connect()
-        
         users_collection = self.db[DBS.Collections.USERS]
         
         # DOC: Retrieve the user by its ID
@@ -143,7 +213,6 @@ class DatabaseInterface():
     
     
     def chat_by_thread_id(self, thread_id: str):
-        self.connect()
         chats_collection = self.db[DBS.Collections.CHATS]
         chat = chats_collection.find_one({ 'thread_id': thread_id })
         chat = db_utils.cast_to_schema(DBS.Chat, chat)
@@ -160,18 +229,17 @@ class DatabaseInterface():
             messages (list | dict): The messages to be added to the chat.
         """
         
-        self.connect()
-        
         chats_collection = self.db[DBS.Collections.CHATS]
         
-        if self.chat_by_thread_id(thread_id = chat.thread_id) is None:
-            # DOC: If the chat does not exist, create a new one
-            chats_collection.insert_one(chat.as_anon_dict)
-        else:
-            chats_collection.update_one(
-                { 'thread_id': chat.thread_id },
-                { "$push": { "messages": { "$each": chat.pending_messages } } }
-            )
+        # DOC: Single round-trip — creates the chat if it does not exist, then appends the pending messages
+        chats_collection.update_one(
+            { 'thread_id': chat.thread_id },
+            {
+                '$setOnInsert': chat.as_anon_dict_without_messages,
+                '$push': { 'messages': { '$each': chat.pending_messages } }
+            },
+            upsert = True
+        )
         
         chat.empty_pending()
         
@@ -187,8 +255,6 @@ class DatabaseInterface():
             dict: Chat document.
         """
         
-        self.connect()
-        
         chats_collection = self.db[DBS.Collections.CHATS]
         
         # DOC: Retrieve the chat by its user ID
@@ -1,6 +1,8 @@
 import os
 
+import orjson
 import nbformat as nbf
+from nbformat.v4.rwbase import rejoin_lines
 
 from bson import ObjectId
 
@@ -85,9 +87,17 @@ class Chat(Record):
         """
         Convert the chat to a dictionary.
         """
-        obj = super().as_dict
-        _ = obj.pop('pending_messages')
-        return obj        
+        obj = { k: v for k, v in super().as_dict.items() if k != 'pending_messages' }   # DOC: Copy, pending_messages must survive serialization
+        return obj
+    
+    @property
+    def as_anon_dict_without_messages(self):
+        """
+        Chat dictionary without _id and messages (used as insert-only fields on upsert).
+        """
+        obj = self.as_anon_dict
+        _ = obj.pop('messages')
+        return obj
     
     def empty_pending(self):
         self.pending_messages = []
@@ -108,30 +118,58 @@ class Notebook(Record):
     def __init__(
             self, 
             name: str, 
-            source: str | nbf.NotebookNode = "{\"cells\": []}",     # DOC: Empty notebook by default
-            authors: str | list[str] = [],                          # DOC: No author by default
+            source: str | dict | nbf.NotebookNode = None,            # DOC: Empty notebook by default
+            authors: str | list[str] | None = [],                   # DOC: No author by default
             description: str = None,
+            validate: bool = False,                                 # DOC: Validate string sources against the nbformat schema (not needed for our own writes)
+            source_hash: str = None,                                # DOC: Digest of the uploaded file, set on upload only (cleared by any later save)
             **kwargs
         ):
         super().__init__(**kwargs)
         self.name = name
-        self.source = nbf.reads(source, as_version=4) if isinstance(source, str) else source
-        self.authors = authors if isinstance(authors, list) else [authors]
+        if source is None:
+            self.source = nbf.v4.new_notebook()
+        elif isinstance(source, nbf.NotebookNode):
+            self.source = source
+        elif isinstance(source, dict):
+            self.source = nbf.from_dict(source)                     # DOC: Stored as native BSON document, no JSON parse needed
+        elif validate:
+            self.source = nbf.reads(source, as_version=4)
+        else:
+            self.source = rejoin_lines(nbf.from_dict(orjson.loads(source)))   # DOC: Legacy records stored the notebook as a JSON string, trusted so no schema validation (multiline strings rejoined as nbf.reads does)
+        self.authors = [] if authors is None else [authors] if type(authors) is str else list(authors)   # DOC: Always an own list (never the shared default one)
         self.description = description
+        self.source_hash = source_hash
+        self.pending_cells = []
         
     @property
     def as_dict(self):
         """
         Convert the notebook to a dictionary.
         """
-        obj = super().as_dict
-        obj['source'] = nbf.writes(self.source)
+        obj = { k: v for k, v in super().as_dict.items() if k != 'pending_cells' }
+        obj['source'] = dict(self.source)   # DOC: NotebookNode is a dict, MongoDB stores it natively (copy to leave self.source untouched)
         return obj
     
+    def empty_pending(self):
+        self.pending_cells = []
+    
+    def add_cells(self, cells: list | nbf.NotebookNode):
+        """
+        Append cells to the notebook, tracking them so that saving an existing notebook only pushes the new cells.
+        (Only for notebooks whose other fields and cells are left untouched, otherwise modify source and save the whole notebook)
+        """
+        self.source.cells.extend(cells if isinstance(cells, list) else [cells])
+        self.pending_cells.extend(cells if isinstance(cells, list) else [cells])
+    
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d, validate=False)
+    
     @property
     def source_code(self):
         """
         Convert the notebook source to a string.
         """
-        return nbf.writes(self.source)
+        return orjson.dumps(self.source).decode()    # DOC: Plain JSON is a valid .ipynb, no need for nbformat's sorted / indented stdlib dump
     
\ No newline at end of file
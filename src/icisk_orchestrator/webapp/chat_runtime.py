@@ -0,0 +1,224 @@
+# DOC: Chat page runtime — rendering and agent run helpers, imported once (page scripts are re-executed at each rerun)
+
+import html
+import time
+
+import streamlit as st
+
+from webapp import utils
+from webapp import langgraph_interface as lgi
+from webapp.session.state import session_manager, Interrupt
+
+
+
+# REGION: [Intro]
+
+INTRO_MD = """
+This is a multi-agent artificial intelligence system built with LangGraph and OpenAI models.  
+It is designed to assist users in the guided generation of interactive notebooks by leveraging the **ICisk** project APIs for the retrieval, processing, and visualization of climate data.  
+
+The goal is to simplify environmental data analysis through an intelligent conversational interface capable of guiding users step by step in building their data workflows.  
+
+**This is a beta version**. At the moment, it can assist in: 
+
+- Obtaining historical and forecast data relating to precipitation, temperature, and river discharge (with notebook creation).
+- Calculation of the **Standardized Precipitation Index (SPI)** with historical and forecast data (with notebook creation).
+- Code generation targeted to created notebooks.
+
+Additional processing capabilities will be available soon. 
+
+For more details _(i.e: on the agent or on the used data)_, simply interact with the bot.
+"""
+
+# DOC: Static intro converted to HTML once per process (not re-parsed as markdown at each rerun)
+@st.cache_resource
+def intro_html():
+    return utils.markdown_to_html(INTRO_MD)
+
+# ENDREGION: [Intro]
+
+
+
+# REGION: [Rendering]
+
+AVATARS = {
+    "user": None,
+    "assistant": None,
+    "tool": "🛠️"
+}
+
+HISTORY_AVATARS = {     # DOC: Avatars of the HTML history (streamlit default avatars are not available outside st.chat_message)
+    "user": "👤",
+    "assistant": "🤖",
+    "tool": AVATARS["tool"]
+}
+
+# DOC: Neutral translucent background and inherited text color, readable with both light and dark themes
+HISTORY_CSS = """
+<style>
+.chat-history-message { display: flex; gap: 1rem; padding: 1rem; border-radius: 0.5rem; margin-bottom: 1rem; color: inherit; }
+.chat-history-message.user { background-color: rgba(128, 128, 128, 0.1); }
+.chat-history-avatar { flex: 0 0 2rem; font-size: 1.25rem; line-height: 2rem; text-align: center; }
+.chat-history-content { flex: 1; min-width: 0; overflow-x: auto; }
+</style>
+"""
+
+# DOC: Whole history as one HTML block, cached on the history content. Message HTML only comes from utils.markdown_to_html (raw HTML escaped, unsafe URLs dropped)
+@st.cache_data(max_entries=32)
+def _render_history_html(history: tuple[tuple[str, str], ...]) -> str:
+    blocks = [
+        f"<div class='chat-history-message {html.escape(role, quote=True)}'><div class='chat-history-avatar'>{HISTORY_AVATARS.get(role, '')}</div><div class='chat-history-content'>{content_html}</div></div>"
+        for role, content_html in history
+    ]
+    return HISTORY_CSS + "".join(blocks)
+
+def render_chat_history():
+    history = tuple(
+        (message["role"], utils.markdown_to_html(message["content"]) if 'content_html' not in message else message["content_html"])
+        for message in session_manager.chat_history
+    )
+    if history:
+        st.markdown(_render_history_html(history), unsafe_allow_html=True)     # DOC: Single element for the frozen history, new turns use st.chat_message
+
+
+def persist_message(role, content):
+    session_manager.chat_history.append({"role": role, "content": content, "content_html": utils.markdown_to_html(content)})
+
+def render_message(role, content, persist=True):
+    st.chat_message(role, avatar=AVATARS[role]).markdown(content)
+    if persist:
+        persist_message(role, content)
+
+def render_user_prompt(prompt):
+    render_message("user", prompt)
+
+
+class StreamingMessage():
+    """
+    Consecutive assistant messages of a run are written in a single in-place chat message (refreshed at most every THROTTLE seconds), only the final content goes to the chat history.
+    LLM tokens are shown as they arrive and replaced by the complete message once it is received.
+    """
+    
+    THROTTLE = 0.1
+    
+    def __init__(self):
+        self.placeholder = None
+        self.buffer = ''
+        self.partial = ''
+        self.dirty = False
+        self.last_render = 0.0
+        
+    def _ensure_placeholder(self):
+        if self.placeholder is None:
+            self.placeholder = st.chat_message("assistant").empty()
+        
+    def write_token(self, token):
+        self._ensure_placeholder()
+        self.partial += token
+        self.dirty = True
+        
+    def write(self, content):
+        self._ensure_placeholder()
+        self.partial = ''
+        self.buffer = f"{self.buffer}\n\n{content}" if self.buffer else content
+        self.dirty = True
+    
+    def refresh(self, force=False):
+        if self.dirty and (force or time.monotonic() - self.last_render >= self.THROTTLE):
+            self.placeholder.markdown(f"{self.buffer}\n\n{self.partial}" if self.buffer and self.partial else self.buffer or self.partial)
+            self.dirty = False
+            self.last_render = time.monotonic()
+            
+    def flush(self):
+        if self.placeholder is not None:
+            self.partial = ''   # DOC: Tokens without a complete message (e.g. the text of a tool calling message) are not kept
+            self.dirty = True
+            self.refresh(force=True)
+            if self.buffer:
+                persist_message("assistant", self.buffer)   # DOC: One history entry per streamed message, not per chunk
+            else:
+                self.placeholder.empty()
+        self.placeholder = None
+        self.buffer = ''
+        self.partial = ''
+        self.dirty = False
+        
+
+def render_agent_response(message, stream: StreamingMessage):
+    
+    if len(message.get('tool_calls', [])) > 0:
+        stream.flush()   # DOC: Tool calls break the assistant stream, keep messages order
+        tool_contents = []
+        for tool_call in message['tool_calls']:
+            header = f"##### Using tool: _{tool_call['name']}_"
+            tool_table = utils.tool_args_md_table(tool_call['args'])
+            tool_contents.append(f"{header}\n\n{tool_table}" if tool_table else header)
+        render_message("tool", "\n\n".join(tool_contents))   # DOC: Built once, history replay reuses the stored content
+    
+    if len(message.get('content', [])) > 0:
+        if message.get('interrupt', False):
+            message['content'] = f"**Interaction required [ _{message['interrupt']['interrupt_type']}_ ]: 💬**\n\n{message['content']}"
+        stream.write(message['content'])
+
+   
+def handle_response(response, stream: StreamingMessage):
+    if lgi.TOKEN_KEY in response:
+        stream.write_token(response[lgi.TOKEN_KEY])
+        return
+    for author, data in response.items():
+        if data is None:
+            continue
+        message = None
+        if author == 'chatbot':
+            messages = data.get('messages', [])
+            message = messages[-1] if len(messages) > 0 else None
+        elif author == '__interrupt__':
+            message = data[0].get('value', None) if len(data) > 0 else None
+            session_manager.interrupt = Interrupt(interrupt_type = message['interrupt_type'], resume_key=message.get('resume_key', 'response'))
+            message['interrupt'] = session_manager.interrupt.as_dict
+        
+        session_manager.update_chat(message)
+        
+        if message is not None and message.get('type', None) != 'system':
+            render_agent_response(message, stream)
+
+# ENDREGION: [Rendering]
+
+
+
+# REGION: [Agent run]
+
+def optional_resume_interrupt():
+    out = dict()
+    if session_manager.is_interrupted():
+        out['interrupt_response_key'] = session_manager.interrupt.resume_key
+        session_manager.interrupt = None
+    return out
+
+def optional_tool_choice():
+    out = dict()
+    if session_manager.gui.tool_choice is not None and session_manager.gui.tool_choice != 'Use all tools (default)':    # TODO: Use a dict plz
+        out['tool_choice'] = session_manager.gui.tool_choice
+    return out
+        
+def run_chat(prompt):
+    
+    additional_args = {
+        **optional_resume_interrupt(),
+        **optional_tool_choice()
+    }        
+    
+    # DOC: The agent stream runs on the persistent LangGraph loop, messages are rendered here (script thread) in batches (up to 8 messages / 100ms), the assistant placeholder is redrawn once per batch
+    stream = StreamingMessage()
+    for messages in lgi.stream_sync_batched(lgi.ask_agent(
+        session_manager.client, 
+        session_manager.thread_id, 
+        prompt,
+        **additional_args
+    )):
+        for message in messages:
+            handle_response(message, stream)
+        stream.refresh()
+    stream.flush()
+
+# ENDREGION: [Agent run]
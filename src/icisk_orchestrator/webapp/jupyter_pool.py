@@ -0,0 +1,166 @@
+# DOC: Jupyter containers of the code page — pooled per user, imported once (page scripts are re-executed at each rerun)
+
+import re
+import json
+import time
+import datetime
+import urllib.request
+import atexit
+import threading
+import concurrent.futures
+
+import docker
+
+
+
+TOKEN_RE = re.compile(rb"token=([a-f0-9]+)")
+
+def wait_for_token(container, timeout=10):
+    # DOC: Follow the log stream (only new bytes are read), until the token shows up or the timeout expires
+    logs = container.logs(stream=True, follow=True)
+    def follow():
+        tail = b''
+        for chunk in logs:
+            tail = tail[-64:] + chunk       # DOC: Keep the previous chunk end, the token may be split across chunks
+            match = TOKEN_RE.search(tail)
+            if match:
+                return match.group(1).decode("utf-8")
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    try:
+        token = executor.submit(follow).result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        token = None
+    finally:
+        logs.close()
+        executor.shutdown(wait=False)
+    if token is None:
+        raise TimeoutError(f"Jupyter token not found in container {container.short_id} logs")
+    return token
+
+
+def stop_container(container):
+    """ stop_container - stops and removes the container (errors ignored, it may be already gone) """
+    try:
+        container.stop()
+    except docker.errors.DockerException:
+        pass
+    try:
+        container.remove(force=True)
+    except docker.errors.DockerException:
+        pass
+
+
+def jupyter_last_activity(port: str, token: str, timeout=2) -> float | None:
+    """ jupyter_last_activity - timestamp of the last Jupyter server activity (kernels, terminals, API requests), None if not reachable """
+    request = urllib.request.Request(f"http://localhost:{port}/api/status", headers={'Authorization': f'token {token}'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            status = json.loads(response.read())
+        return datetime.datetime.fromisoformat(status['last_activity'].replace('Z', '+00:00')).timestamp()
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+
+class ContainerPool():
+    """
+    One Jupyter container per user, on a host port chosen by docker (no collisions between users).
+    Containers are stopped and removed after IDLE_TTL seconds without use, both from the page and inside Jupyter.
+    """
+
+    IMAGE = "jupyter/base-notebook"
+    IDLE_TTL = 2 * 60 * 60
+    REAP_INTERVAL = 5 * 60
+
+    def __init__(self, client: docker.DockerClient = None):
+        self.client = client if client is not None else docker.from_env()
+        self.lock = threading.Lock()
+        self.user_locks = dict()
+        self.containers = dict()        # DOC: user_id -> { container, port, token, last_used }
+        self._schedule_reaper()
+        atexit.register(self.stop_all)  # DOC: Avoid zombie containers when the server stops
+
+    def _user_lock(self, user_id: str) -> threading.Lock:
+        with self.lock:
+            return self.user_locks.setdefault(user_id, threading.Lock())
+
+    def get_or_create(self, user_id: str, user_dir: str) -> tuple[str, str]:
+        """ get_or_create - returns (host port, token) of the user container, (re)starting it if needed """
+        with self._user_lock(user_id):     # DOC: A (slow) container start only blocks the same user
+            entry = self.containers.get(user_id, None)
+            if entry is not None and not self._is_running(entry['container']):
+                stop_container(entry['container'])     # DOC: Exited / dead container, replaced by a new one
+                entry = None
+            if entry is None:
+                entry = self._start(user_dir)
+                with self.lock:
+                    self.containers[user_id] = entry
+            entry['last_used'] = time.time()
+            return entry['port'], entry['token']
+
+    @staticmethod
+    def _is_running(container) -> bool:
+        try:
+            container.reload()
+        except docker.errors.DockerException:
+            return False
+        return container.status == 'running'
+
+    def _start(self, user_dir: str) -> dict:
+        container = self.client.containers.run(
+            self.IMAGE,
+            detach=True,
+            ports={"8888/tcp": None},   # DOC: Free host port picked by docker
+            volumes={
+                user_dir: {'bind': '/home/jovyan', 'mode': 'rw'}
+            },
+            environment={
+                'JUPYTER_ENABLE_LAB': 'yes'
+            },
+            command=[
+                "start.sh", "jupyter", "lab",
+                "--LabApp.allow_origin='*'",
+                "--LabApp.disable_check_xsrf=True",
+                "--LabApp.tornado_settings={\"headers\": {\"Content-Security-Policy\": \"frame-ancestors *\"}}"
+            ],
+        )
+        try:
+            token = wait_for_token(container)
+            container.reload()
+            port = container.attrs['NetworkSettings']['Ports']['8888/tcp'][0]['HostPort']
+        except Exception:
+            stop_container(container)
+            raise
+        return { 'container': container, 'port': port, 'token': token, 'last_used': time.time() }
+
+    def _schedule_reaper(self):
+        timer = threading.Timer(self.REAP_INTERVAL, self._reap)
+        timer.daemon = True
+        timer.start()
+
+    def _is_idle(self, entry: dict, now: float) -> bool:
+        if now - entry['last_used'] <= self.IDLE_TTL:
+            return False
+        last_activity = jupyter_last_activity(entry['port'], entry['token'])
+        return last_activity is None or now - last_activity > self.IDLE_TTL    # DOC: Work inside the Jupyter iframe does not rerun the page
+
+    def _reap(self):
+        try:
+            with self.lock:
+                user_ids = list(self.containers.keys())
+            for user_id in user_ids:
+                with self._user_lock(user_id):      # DOC: Not concurrently with get_or_create of the same user
+                    entry = self.containers.get(user_id, None)
+                    if entry is None or not self._is_idle(entry, time.time()):
+                        continue
+                    with self.lock:
+                        self.containers.pop(user_id, None)
+                    stop_container(entry['container'])
+        finally:
+            self._schedule_reaper()
+
+    def stop_all(self):
+        with self.lock:
+            entries, self.containers = list(self.containers.values()), dict()
+        for entry in entries:
+            stop_container(entry['container'])
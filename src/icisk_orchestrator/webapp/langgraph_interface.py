@@ -1,10 +1,85 @@
-from langgraph_sdk.client import get_client, LangGraphClient, Command
+import time
+import queue
+import asyncio
+import threading
+import concurrent.futures
+
+import httpx
+from langgraph_sdk.client import LangGraphClient, Command
 
 # from icisk_chat.logger import Logger, fmsg
 
 
+
+# DOC: Single persistent event loop, running in a background thread and shared by every session / rerun (the LangGraph client connection pool lives on it)
+try:
+    import uvloop                   # DOC: Faster loop implementation where available (not on Windows)
+    _LOOP = uvloop.new_event_loop()
+except ImportError:
+    _LOOP = asyncio.new_event_loop()
+threading.Thread(target=_LOOP.run_forever, name='langgraph-loop', daemon=True).start()
+
+_STREAM_END = object()
+
+TOKEN_KEY = '__token__'     # DOC: Key of the partial LLM output items yielded by ask_agent (besides the node updates)
+
+
+def run_sync(coro):
+    """ run_sync - runs a coroutine on the persistent loop and waits for its result """
+    return asyncio.run_coroutine_threadsafe(coro, _LOOP).result()
+
+def _pump(async_gen) -> tuple[queue.Queue, concurrent.futures.Future]:
+    """ _pump - producer side, drains async_gen on the persistent loop into a queue (the stream never waits for the caller rendering) """
+    items = queue.Queue()
+    async def pump():
+        try:
+            async for item in async_gen:
+                items.put(item)
+        except Exception as e:
+            items.put(e)
+        finally:
+            items.put(_STREAM_END)
+    return items, asyncio.run_coroutine_threadsafe(pump(), _LOOP)
+
+def stream_sync_batched(async_gen, max_items: int = 8, max_wait: float = 0.1):
+    """ stream_sync_batched - iterates an async generator on the persistent loop, yielding to the (sync) caller lists of the items arrived within max_wait seconds from the first one (at most max_items) """
+    items, producer = _pump(async_gen)
+    try:
+        ended = False
+        while not ended:
+            item = items.get()
+            if item is _STREAM_END:
+                break
+            batch = [item]
+            deadline = time.monotonic() + max_wait
+            while len(batch) < max_items:
+                try:
+                    item = items.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is _STREAM_END:
+                    ended = True
+                    break
+                batch.append(item)
+            error = next((i for i in batch if isinstance(i, Exception)), None)
+            if error is not None:
+                yield batch[:batch.index(error)]
+                raise error
+            yield batch
+    finally:
+        producer.cancel()   # DOC: Consumer gone (e.g. script rerun / stopped), stop the stream too
+
+
+# DOC: Keep-alive pool of the HTTP client to the LangGraph server (one client per process, see session state)
+_HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60)
+
 def get_langgraph_client():
-    client = get_client(url="http://localhost:2024")    # TODO: set url to env variable
+    http_client = httpx.AsyncClient(
+        base_url = "http://localhost:2024",    # TODO: set url to env variable
+        transport = httpx.AsyncHTTPTransport(retries=5, limits=_HTTP_LIMITS),
+        timeout = httpx.Timeout(connect=5, read=300, write=300, pool=5)     # DOC: Same as langgraph_sdk.get_client defaults
+    )
+    client = LangGraphClient(http_client)
     return client
 
     
@@ -40,10 +115,11 @@ async def ask_agent(
         if tool_choice is not None: 
             run_args['input']['node_params'] = {'chatbot': {'tool_choice': tool_choice}}
     
+    # DOC: Node updates carry the complete messages (chat history, interrupts, tool calls), chatbot LLM tokens are streamed alongside for early display
     async for chunk in client.runs.stream(
         thread_id,
         "agent",
-        stream_mode="updates",
+        stream_mode=["updates", "messages-tuple"],
         **run_args
     ):
         if chunk.event == "updates":
@@ -51,4 +127,9 @@ async def ask_agent(
             # Logger.info(fmsg("Received updates from agent", m=chunk.data, s=1, ls=True, pp=True))
             print(f'\n\nReceived updates from agent: {chunk.data} \n\n')
             
-            yield chunk.data
\ No newline at end of file
+            yield chunk.data
+            
+        elif chunk.event == "messages":
+            message_chunk, metadata = chunk.data
+            if metadata.get('langgraph_node') == 'chatbot' and isinstance(message_chunk.get('content'), str) and message_chunk['content']:
+                yield { TOKEN_KEY: message_chunk['content'] }
@@ -1,16 +1,16 @@
 import os
-import re
-import time
+import hashlib
+import tempfile
+import functools
+import concurrent.futures
 import requests
 
-import nbformat as nbf
-
-import docker
 import streamlit as st
 
 from db import DBI
 from webapp import langgraph_interface as lgi
 from webapp.session.state import session_manager
+from webapp.jupyter_pool import ContainerPool
 
 import streamlit.components.v1 as components
 
@@ -23,42 +23,49 @@ st.markdown("##### AI code")
 PROJECT_DIR = os.path.abspath(".")
 TMP_DIR = os.path.join(PROJECT_DIR, "tmp_run")
 
-notebooks = DBI.notebooks_by_author(author=session_manager.user_id, retrieve_source=True)
-os.makedirs(os.path.join(TMP_DIR, session_manager.user_id), exist_ok=True)
-for notebook in notebooks:
-    notebook_path = os.path.join(TMP_DIR, session_manager.user_id, notebook.name)
-    with open(notebook_path, "w", encoding='utf-8') as f:
-        nbf.write(notebook.source, f)
+USER_DIR = os.path.join(TMP_DIR, session_manager.user_id)   # DOC: Session files directory, computed once per run
+
+SYNC_DIR = os.path.join(TMP_DIR, ".sync", session_manager.user_id)   # DOC: Hash sidecars and temp files, outside the directory mounted as Jupyter home
+
+def _write_notebook(user_dir: str, sync_dir: str, notebook) -> tuple[str, str]:
+    notebook_path = os.path.join(user_dir, notebook.name)
+    hash_path = os.path.join(sync_dir, f"{notebook.name}.hash")
+    source_code = notebook.source_code.encode('utf-8')
+    source_hash = hashlib.blake2b(source_code).hexdigest()
+    disk_hash = None
+    if os.path.exists(notebook_path) and os.path.exists(hash_path):
+        with open(hash_path, "r", encoding='utf-8') as f:
+            disk_hash = f.read().strip()
+    if disk_hash != source_hash:
+        # DOC: Atomic replace (same filesystem), Jupyter never sees a half written notebook
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=sync_dir, suffix='.tmp')
+        with os.fdopen(tmp_fd, "wb") as f:
+            f.write(source_code)
+        os.chmod(tmp_path, 0o644)       # DOC: mkstemp creates owner-only files, keep the usual notebook permissions
+        os.replace(tmp_path, notebook_path)
+        with open(hash_path, "w", encoding='utf-8') as f:
+            f.write(source_hash)
+    return notebook.name, source_hash
+
+# DOC: Mirror the user notebooks on disk, at most once per minute and rewriting (concurrently) only the ones whose source changed
+@st.cache_data(ttl=60)
+def _sync_notebooks(user_id: str, user_dir: str, sync_dir: str) -> list[tuple[str, str]]:
+    os.makedirs(user_dir, exist_ok=True)
+    os.makedirs(sync_dir, exist_ok=True)
+    notebooks = DBI.notebooks_by_author(author=user_id, retrieve_source=True)
+    notebooks = { notebook.name: notebook for notebook in notebooks }.values()      # DOC: One record per file (names can repeat, the last one wins as in a serial write)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        return list(executor.map(functools.partial(_write_notebook, user_dir, sync_dir), notebooks))
+
+_sync_notebooks(session_manager.user_id, USER_DIR, SYNC_DIR)
+
+# DOC: One container pool per process, shared by every session (containers are reused across reruns and sessions of the same user)
+@st.cache_resource
+def _container_pool():
+    return ContainerPool()
+
 
 with st.spinner("Loading code environment ...", show_time=True):
-    client = docker.from_env()
-
-    container = client.containers.run(
-        "jupyter/base-notebook",
-        detach=True,
-        ports={"8888/tcp": 8888},
-        volumes={
-            os.path.join(TMP_DIR, session_manager.user_id): {'bind': '/home/jovyan', 'mode': 'rw'}
-        },
-        environment={
-            'JUPYTER_ENABLE_LAB': 'yes'
-        },
-        command=[
-            "start.sh", "jupyter", "lab",
-            "--LabApp.allow_origin='*'",
-            "--LabApp.disable_check_xsrf=True",
-            "--LabApp.tornado_settings={\"headers\": {\"Content-Security-Policy\": \"frame-ancestors *\"}}"
-        ],
-    )
-
-    
-    time.sleep(10)   # FIXME: this is ugly
-    
-    logs = container.logs().decode("utf-8")
-    match = re.search("token=([a-f0-9]+)", logs)
-    
-    token = match.group(1)
-    
-    print(token)
-    
-    components.iframe(f"http://localhost:8888/lab?token={token}", height=500)
\ No newline at end of file
+    port, token = _container_pool().get_or_create(session_manager.user_id, USER_DIR)
+
+components.iframe(f"http://localhost:{port}/lab?token={token}", height=500)
@@ -1,7 +1,10 @@
 import os
+import collections
 
-import nest_asyncio; nest_asyncio.apply()
 import asyncio
+# DOC: Agent calls run on the persistent loop of langgraph_interface (never re-entered), nested loops only patched on developer request
+if os.environ.get("ICISK_ALLOW_NESTED_LOOP") and not getattr(asyncio, '_nest_patched', False):
+    import nest_asyncio; nest_asyncio.apply()
 
 import streamlit as st
 
@@ -11,23 +14,46 @@ from webapp import langgraph_interface as lgi
 
 
 
+# DOC: Notebook list / source are cached across reruns (invalidated on upload and refresh)
+@st.cache_data(ttl=30)      # DOC: Short, notebooks are also saved by the agent (server side, no invalidation from here)
+def _list_notebooks(user_id):
+    return DBI.notebooks_by_author(user_id, retrieve_source=False)
+
+@st.cache_data(ttl=300, max_entries=64)     # DOC: Bounded, sources can be MBs each
+def _load_notebook(user_id, notebook_name):
+    notebook = DBI.notebook_by_name(author=user_id, notebook_name=notebook_name, retrieve_source=True)
+    return notebook.source_code if notebook is not None else None
+
+
+
 class GUI():
     def __init__(self):
         self.chat_input = dict()
-        self.file_downloader = dict()
+        self.requested_downloads: set[str] = set()
+        self.view_request: str = None           # DOC: File to open in the view dialog (set from the file table)
+        self.file_table_version: int = 0
         self.tool_choice: str = None
     
     @property 
     def filenames(self) -> list | None:
-        return DBI.notebooks_by_author(st.session_state.app.user_id, retrieve_source=False)
+        return _list_notebooks(st.session_state.app.user_id)
+    
+    def notebook_source(self, filename) -> str | None:
+        return _load_notebook(st.session_state.app.user_id, filename)
+    
+    def invalidate_notebooks(self):
+        _list_notebooks.clear()
+        _load_notebook.clear()
+        self.requested_downloads.clear()
     
     def request_download(self, filename):
-        if filename not in self.file_downloader:
-            self.file_downloader[filename] = dict()
-        self.file_downloader[filename].update({'requested': True})
+        self.requested_downloads.add(filename)
         
     def is_requested_download(self, filename):
-        return self.file_downloader.get(filename, dict()).get('requested', False)
+        return filename in self.requested_downloads
+    
+    def download_source(self, filename) -> str | None:
+        return self.notebook_source(filename)      # DOC: Through the source cache (refreshed on ttl / refresh / upload), never a stale per-session copy
     
     @property
     def chat_register(self) -> dict | None:
@@ -57,12 +83,22 @@ class Interrupt():
     
         
 
+# DOC: LangGraph client is built once per process and shared by every session / rerun
+@st.cache_resource
+def _get_client():
+    return lgi.get_langgraph_client()
+        
+
+
+CHAT_HISTORY_MAXLEN = 200     # DOC: Rendered messages kept in session (full chat is stored in DB)
+
 class WebAppState():
     
     def __init__(self, user_id):
         self.user_id = user_id
-        self.thread_id = asyncio.run(lgi.create_thread(lgi.get_langgraph_client(), self.user_id))
-        self.chat_history = []                      # DOC: relative to Chat Messages (to be rendered in GUI)
+        self.client = _get_client()
+        self.thread_id = lgi.run_sync(lgi.create_thread(self.client, self.user_id))
+        self.chat_history = collections.deque(maxlen=CHAT_HISTORY_MAXLEN)     # DOC: relative to Chat Messages (to be rendered in GUI), bounded to the last messages
         self.chat: DBS.Chat = None
         self.gui = GUI()                            # TODO: To be deleted, will use self.chat.messages ( + filter by author when rendering )
         self.interrupt: Interrupt = None            # DOC: graph is interrupted, we have to handle resume command  
@@ -82,58 +118,57 @@ class SessionManager():
         st.session_state.app = WebAppState(user_id=user_id)
         
     @property
-    def user_id(self):
-        return st.session_state.app.user_id if hasattr(st.session_state, 'app') else None
-    
-    @property
-    def thread_id(self):
-        return st.session_state.app.thread_id if hasattr(st.session_state, 'app') else None
-    
-    @property
-    def client(self):
-        return lgi.get_langgraph_client() if hasattr(st.session_state, 'app') else None
+    def _app(self) -> WebAppState | None:
+        return st.session_state.get('app', None)   # DOC: Single lookup, no hasattr
+        
+    # DOC: Plain WebAppState attributes are proxied (None when the app state is not set up yet)
+    _APP_ATTRIBUTES = ('user_id', 'thread_id', 'client', 'chat_history', 'chat', 'gui')
     
-    @property
-    def chat_history(self):
-        return st.session_state.app.chat_history if hasattr(st.session_state, 'app') else None
+    def __getattr__(self, name):
+        if name in SessionManager._APP_ATTRIBUTES:
+            app = self._app
+            return getattr(app, name) if app is not None else None
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
     
-    @property
-    def chat(self) -> DBS.Chat | None:
-        return st.session_state.app.chat if hasattr(st.session_state, 'app') else None
     def new_chat(self, title: str = 'New Chat'):
-        st.session_state.app.chat = DBS.Chat(user_id=self.user_id, thread_id=self.thread_id, title=title,  messages=[] )
+        app = self._app
+        app.chat = DBS.Chat(user_id=app.user_id, thread_id=app.thread_id, title=title,  messages=[] )
     def update_chat(self, messages: list | dict):
-        if self.chat is None:
+        app = self._app
+        if app.chat is None:
             messages = messages if isinstance(messages, list) else [messages]
             self.new_chat(title=messages[0].get('content', 'New Chat') if len(messages)>0 else 'New Chat')
-        self.chat.add_messages(messages)
-        DBI.update_chat(self.chat)
+        app.chat.add_messages(messages)
+        DBI.update_chat(app.chat)
     def close_chat(self):
-        if self.chat is not None:
-            DBI.update_chat(self.chat)
-            st.session_state.app.chat = None
-            st.session_state.app.chat_history = []
-    
-    @property
-    def gui(self) -> GUI | None:
-        return st.session_state.app.gui if hasattr(st.session_state, 'app') else None
+        app = self._app
+        if app is not None and app.chat is not None:
+            DBI.update_chat(app.chat)
+            app.chat = None
+            app.chat_history = collections.deque(maxlen=CHAT_HISTORY_MAXLEN)
     
     @property
     def node_history(self):
-        return st.session_state.app.node_history if hasattr(st.session_state, 'app') else None
+        app = self._app
+        return app.node_history if app is not None else None
     @node_history.setter
     def node_history(self, value):
-        self.node_history.append(value) if hasattr(st.session_state, 'app') else None
+        app = self._app
+        if app is not None:
+            app.node_history.append(value)
     
     @property
     def interrupt(self) -> Interrupt | None:
-        return st.session_state.app.interrupt if hasattr(st.session_state, 'app') else None
+        app = self._app
+        return app.interrupt if app is not None else None
     @interrupt.setter
     def interrupt(self, value: Interrupt | None):
-        if hasattr(st.session_state, 'app'):
-            st.session_state.app.interrupt = value
+        app = self._app
+        if app is not None:
+            app.interrupt = value
     def is_interrupted(self):
-        return self.interrupt is not None
+        app = self._app
+        return app is not None and app.interrupt is not None
     
 
 # DOC: Initialize the session manager
@@ -1,7 +1,16 @@
 import os
+import re
+import html
+import json
+from urllib.parse import urlparse
 
+import orjson
+import markdown
+from markdown.extensions import Extension
+from markdown.preprocessors import Preprocessor
+from markdown.treeprocessors import Treeprocessor
 import nbformat as nbf
-from nbconvert import HTMLExporter
+from nbformat.v4.rwbase import rejoin_lines
 
 import streamlit as st
 import streamlit.components.v1 as components
@@ -9,15 +18,106 @@ import streamlit.components.v1 as components
 
 
 def tool_args_md_table(args_dict):
-    if all([v is None for k,v in args_dict.items()]):
+    if not any(v is not None for v in args_dict.values()):     # DOC: No table, short-circuit before serializing the cache key
         return ''
-    else:
-        table = "| Parameter | Value |\n"
-        table += "|-----------|--------|\n"
-        for key, value in args_dict.items():
-            if value is not None:
-                table += f"| {key} | {value} |\n"
-        return table
+    return _tool_args_md_table(json.dumps(args_dict, default=str))   # DOC: JSON (order preserving) as cache key
+
+@st.cache_data
+def _tool_args_md_table(args_json):
+    args_dict = json.loads(args_json)
+    rows = [f"| {key} | {value} |" for key, value in args_dict.items() if value is not None]     # DOC: Single pass, empty when all args are None
+    if not rows:
+        return ''
+    return "| Parameter | Value |\n|-----------|--------|\n" + "\n".join(rows) + "\n"
+    
+
+
+# REGION: [Chat markdown]
+
+_LIST_ITEM_RE = re.compile(r'^\s*([-*+]|\d+[.)])\s+')
+_FENCE_RE = re.compile(r'^\s*(```|~~~)')
+_SAFE_URL_SCHEMES = ('http', 'https', 'mailto')
+_URL_IGNORED_CHARS_RE = re.compile(r'[\x00-\x20\x7f]+')     # DOC: Browsers ignore them in the scheme (e.g. 'java\tscript:')
+
+class _GfmListPreprocessor(Preprocessor):
+    """ Lists may start right after a paragraph line (as in streamlit GFM markdown), python-markdown needs a blank line before them """
+    def run(self, lines):
+        out = []
+        fenced = False
+        for line in lines:
+            if _FENCE_RE.match(line):
+                fenced = not fenced
+            elif not fenced and _LIST_ITEM_RE.match(line) and len(out) > 0 and out[-1].strip() and not _LIST_ITEM_RE.match(out[-1]):
+                out.append('')
+            out.append(line)
+        return out
+
+def _is_safe_url(url: str) -> bool:
+    """ _is_safe_url - True for http(s) / mailto and plain relative URLs, checked as the browser reads them (entities decoded, control chars / whitespaces dropped) """
+    url = url.replace(markdown.util.AMP_SUBSTITUTE, '&')
+    while (unescaped := html.unescape(url)) != url:     # DOC: Until stable, nested encodings can not hide the scheme
+        url = unescaped
+    url = _URL_IGNORED_CHARS_RE.sub('', url)
+    scheme = urlparse(url).scheme.lower()
+    if scheme != '':
+        return scheme in _SAFE_URL_SCHEMES
+    return ':' not in re.split(r'[/?#]', url, maxsplit=1)[0]      # DOC: No scheme-like prefix urlparse did not recognize
+
+class _SafeUrlTreeprocessor(Treeprocessor):
+    """ Drop links / images with non web URLs (e.g. javascript:, also entity encoded) """
+    def run(self, root):
+        for element in root.iter():
+            if element.tag not in ('a', 'img'):
+                continue
+            for attr in ('href', 'src'):
+                url = element.get(attr, None)
+                if url is not None and not _is_safe_url(url):
+                    del element.attrib[attr]
+
+class _SafeChatExtension(Extension):
+    """ Raw HTML is escaped as text (as streamlit markdown does), not passed through """
+    def extendMarkdown(self, md):
+        md.preprocessors.deregister('html_block')
+        md.inlinePatterns.deregister('html')
+        md.preprocessors.register(_GfmListPreprocessor(md), 'gfm_lists', 27)   # DOC: Before fenced_code (25), fences are skipped by hand
+        md.treeprocessors.register(_SafeUrlTreeprocessor(md), 'safe_urls', 5)    # DOC: After the inline patterns (20) built the links
+
+
+def markdown_to_html(content: str) -> str:
+    """
+    Convert a chat message markdown to (safe) HTML once, so history replay can skip the frontend markdown parsing.
+    """
+    return markdown.markdown(content, extensions=[_SafeChatExtension(), 'tables', 'fenced_code', 'nl2br', 'sane_lists'])
+
+# ENDREGION: [Chat markdown]
+    
+    
+def _notebook_to_html(nb: nbf.NotebookNode) -> str:
+    from nbconvert import HTMLExporter      # DOC: Lazy, nbconvert (jinja, pygments, ...) is only needed when a notebook is viewed
+    html_exporter = HTMLExporter()
+    body, _ = html_exporter.from_notebook_node(nb)
+    return body
+
+def _parse_notebook(source: str) -> nbf.NotebookNode:
+    return rejoin_lines(nbf.from_dict(orjson.loads(source)))     # DOC: Sources come from our DB (Notebook.source_code), no schema validation needed
+
+# DOC: Rendered notebooks are cached by source (bounded, the HTML is larger than the source), opening the same notebook again skips both parse and HTML export
+@st.cache_data(ttl=300, max_entries=16)
+def _notebook_html(source: str) -> str:
+    return _notebook_to_html(_parse_notebook(source))
+
+
+# DOC: Dialog is declared once at module level (not re-decorated at each call)
+@st.dialog("Notebook", width="large")
+def show_ipynb_code(filename: str, notebook_code: str | nbf.NotebookNode):
+    st.html("<span class='big-dialog'></span>")
+    st.markdown(f"##### `{filename}`")
+    
+    html = _notebook_to_html(notebook_code) if isinstance(notebook_code, nbf.NotebookNode) else _notebook_html(notebook_code)
+    components.html(html, height=800, scrolling=True)
+    
+    if st.button("Close"):
+        st.rerun() 
     
     
 def dialog_notebook_code(dialog_title: str, notebook_code: str | nbf.NotebookNode):
@@ -33,24 +133,7 @@ def dialog_notebook_code(dialog_title: str, notebook_code: str | nbf.NotebookNod
         unsafe_allow_html=True,
     )
     
-    @st.dialog(dialog_title, width="large")
-    def show_ipynb_code(notebook_code: str | nbf.NotebookNode):
-        st.html("<span class='big-dialog'></span>")
-        
-        def convert_notebook_str_to_html(nb_str):
-            nb = nbf.reads(nb_str, as_version=4)
-            html_exporter = HTMLExporter()
-            body, _ = html_exporter.from_notebook_node(nb)
-            return body
-
-        notebook_str = nbf.writes(notebook_code, version=4) if isinstance(notebook_code, nbf.NotebookNode) else notebook_code
-        html = convert_notebook_str_to_html(notebook_str)
-        components.html(html, height=800, scrolling=True)
-        
-        if st.button("Close"):
-            st.rerun() 
-    
-    show_ipynb_code(notebook_code)
+    show_ipynb_code(dialog_title, notebook_code)
     
     
 def css_component(component, key: str, css_dict: dict[str, str], **component_args):
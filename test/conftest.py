@@ -0,0 +1,8 @@
+import os
+import sys
+
+# DOC: Packages (agent, db, webapp) live under src/icisk_orchestrator (see [tool.setuptools.package-dir] in pyproject.toml)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'icisk_orchestrator'))
+
+# DOC: Manual scripts, not pytest modules (test_docker.py starts a container at import)
+collect_ignore = ['test_docker.py']
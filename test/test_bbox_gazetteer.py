@@ -0,0 +1,16 @@
+from agent.common import bbox_gazetteer
+
+
+def test_normalize_area_name():
+    assert bbox_gazetteer.normalize_area_name("  North   AMERICA ") == "north america"
+
+
+def test_bbox_from_gazetteer():
+    bbox = bbox_gazetteer.bbox_from_gazetteer(" Europe ")
+    assert bbox == [-25.0, 34.0, 45.0, 72.0]
+    bbox.append(0.0)
+    assert bbox_gazetteer.bbox_from_gazetteer("europe") == [-25.0, 34.0, 45.0, 72.0]     # DOC: Returned lists are copies
+
+
+def test_bbox_from_gazetteer_unknown():
+    assert bbox_gazetteer.bbox_from_gazetteer("atlantis") is None
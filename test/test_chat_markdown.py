@@ -0,0 +1,35 @@
+import pytest
+
+from webapp.utils import markdown_to_html
+
+
+@pytest.mark.parametrize('content', [
+    "[x](javascript:alert(1))",
+    "[x](javascript&#58;alert(1))",
+    "[x](&#106;avascript:alert(1))",
+    "[x](java&#x09;script:alert(1))",
+    "[x](JaVaScRiPt:alert(1))",
+    "[x](data:text/html;base64,PHNjcmlwdD4=)",
+    "![i](javascript&colon;alert(1))",
+    "[r]\n\n[r]: javascript&#58;alert(1)",
+])
+def test_unsafe_urls_are_dropped(content):
+    out = markdown_to_html(content)
+    assert 'href=' not in out
+    assert 'src=' not in out
+
+
+@pytest.mark.parametrize('url', ["https://example.com/a?b=1", "mailto:a@b.c", "notebook.ipynb", "/files/a.ipynb", "#section"])
+def test_safe_urls_are_kept(url):
+    assert f'href="{url}"' in markdown_to_html(f"[x]({url})")
+
+
+def test_raw_html_is_escaped():
+    out = markdown_to_html("a < b <script>alert(1)</script> <img src=x onerror=alert(1)>")
+    assert '<script>' not in out
+    assert '<img' not in out
+    assert 'a &lt; b' in out
+
+
+def test_list_right_after_paragraph():
+    assert '<li>one</li>' in markdown_to_html("Items:\n- one\n- two")
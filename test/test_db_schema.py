@@ -0,0 +1,68 @@
+import nbformat as nbf
+
+from db import DBS
+
+
+def _notebook():
+    nb = nbf.v4.new_notebook()
+    nb.cells.append(nbf.v4.new_markdown_cell("# Title"))
+    nb.cells.append(nbf.v4.new_code_cell("x = 1\ny = 2"))
+    return nb
+
+
+def test_legacy_string_source_matches_bson_dict_source():
+    nb = _notebook()
+    legacy = DBS.Notebook(name='nb.ipynb', source=nbf.writes(nb))       # DOC: Legacy records, notebook as JSON string (multiline sources split in lists)
+    stored = DBS.Notebook(name='nb.ipynb', source=dict(nb))             # DOC: Current records, notebook as BSON document
+    assert legacy.source == nbf.reads(nbf.writes(nb), as_version=4)
+    assert legacy.source == stored.source
+    assert legacy.source.cells[1].source == "x = 1\ny = 2"
+
+
+def test_source_code_round_trip():
+    notebook = DBS.Notebook(name='nb.ipynb', source=_notebook())
+    assert DBS.Notebook(name='nb.ipynb', source=notebook.source_code).source == notebook.source
+    assert nbf.reads(notebook.source_code, as_version=4) == notebook.source
+
+
+def test_as_dict_round_trip():
+    notebook = DBS.Notebook(name='nb.ipynb', source=_notebook(), authors='user', description='desc')
+    record = notebook.as_anon_dict
+    assert '_id' not in record
+    assert 'pending_cells' not in record
+    assert isinstance(record['source'], dict)
+    restored = DBS.Notebook.from_dict(record)
+    assert restored.source == notebook.source
+    assert restored.authors == ['user']
+    assert restored.description == 'desc'
+
+
+def test_as_dict_leaves_notebook_untouched():
+    notebook = DBS.Notebook(name='nb.ipynb', source=_notebook())
+    record = notebook.as_dict
+    record['source']['cells'] = []
+    assert len(notebook.source.cells) == 2
+    assert hasattr(notebook, '_id')
+
+
+def test_authors():
+    assert DBS.Notebook(name='nb.ipynb').authors == []
+    assert DBS.Notebook(name='nb.ipynb', authors=None).authors == []
+    assert DBS.Notebook(name='nb.ipynb', authors='user').authors == ['user']
+    authors = ['a', 'b']
+    notebook = DBS.Notebook(name='nb.ipynb', authors=authors)
+    notebook.authors.append('admin')
+    assert authors == ['a', 'b']
+    assert DBS.Notebook(name='other.ipynb').authors == []     # DOC: Default list is never shared
+
+
+def test_add_cells_tracks_pending():
+    notebook = DBS.Notebook(name='nb.ipynb', source=_notebook())
+    notebook.add_cells(nbf.v4.new_code_cell("z = 3"))
+    notebook.add_cells([nbf.v4.new_code_cell("a"), nbf.v4.new_code_cell("b")])
+    assert [cell.source for cell in notebook.pending_cells] == ["z = 3", "a", "b"]
+    assert len(notebook.source.cells) == 5
+    assert 'pending_cells' not in notebook.as_dict
+    notebook.empty_pending()
+    assert notebook.pending_cells == []
+    assert len(notebook.source.cells) == 5
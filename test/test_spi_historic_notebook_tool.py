@@ -0,0 +1,16 @@
+import datetime
+
+import pytest
+
+from agent.nodes.tools.spi_historic_notebook_tool import _parse_ymd
+
+
+def test_parse_ymd():
+    assert _parse_ymd("2025-01-31") == datetime.datetime(2025, 1, 31)
+
+
+@pytest.mark.parametrize('s', ["2025-W01-1", "2025W011", "20250131", "2025-13-01", "2025-1-1x", "31-01-2025"])
+def test_parse_ymd_rejects_non_ymd(s):
+    # DOC: Accepted dates must be parsable by the notebook strptime('%Y-%m-%d')
+    with pytest.raises(ValueError):
+        _parse_ymd(s)